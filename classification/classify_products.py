@@ -1,8 +1,12 @@
 import os
-import json
+import orjson
+import hashlib
+import pickle
 import pandas as pd
 import faiss
 import numpy as np
+import torch
+import torch.nn.functional as F
 from pathlib import Path
 from sentence_transformers import SentenceTransformer
 from transformers import pipeline
@@ -20,6 +24,7 @@ CLASSIFICATION_CSV = BASE_DIR / "classification" / "data" / "classification_tree
 CACHE_DIR = BASE_DIR / "classification" / ".cache"
 FAISS_INDEX_FILE = CACHE_DIR / "faiss_index.bin"
 TAXONOMY_CACHE_FILE = CACHE_DIR / "taxonomy_df.pkl"
+RESULT_CACHE_FILE = CACHE_DIR / "result_cache.pkl"
 
 
 os.makedirs(CACHE_DIR, exist_ok=True)
@@ -28,175 +33,421 @@ EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 
 LLM_MODEL = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
 
+# 4-bit GPTQ export of the same checkpoint; used when a GPTQ-capable
+# loader (optimum + gptqmodel) is installed.
+LLM_MODEL_GPTQ = "TheBloke/TinyLlama-1.1B-Chat-v1.0-GPTQ"
+
+LLM_BATCH_SIZE = 16
+
 # =========================================
 
+EMBED_BATCH_SIZE = 64
+
+# Taxonomies larger than this get an IVF+PQ index instead of exhaustive search.
+IVF_PQ_THRESHOLD = 10_000
+
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+
 def clean_text(text):
     if not isinstance(text, str):
         return ""
-    text = re.sub(r"<[^>]+>", " ", text)
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
+    return _WS_RE.sub(" ", _HTML_TAG_RE.sub(" ", text)).strip()
+
+def text_cache_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+def build_product_text(product):
+    return " ".join(
+        clean_text(str(product.get(k, "")))
+        for k in [
+            "product_name",
+            "short_description",
+            "long_description",
+            "technical_specifications"
+        ]
+    )
 
 # ---------- TAXONOMY ----------
 def load_taxonomy(csv_path):
-    df = pd.read_csv(csv_path)
-
-    parent_ids = set(df['parent_id'].dropna().astype(int))
-    df['is_leaf'] = ~df['id'].isin(parent_ids)
-    df = df[df['is_leaf']].copy()
-
+    # One read serves both the id->name map (all rows) and the leaf view.
     full_df = pd.read_csv(csv_path)
-    id_to_name = full_df.set_index('id')['name'].to_dict()
-
-    def resolve_path(path_str):
-        ids = str(path_str).split(".")
-        names = [id_to_name.get(int(i), f"Unknown({i})") for i in ids]
-        return " > ".join(names)
-
-    df['path_text'] = df['path'].apply(resolve_path)
+    id_to_name = dict(zip(full_df['id'].astype(int), full_df['name']))
+
+    parent_ids = set(full_df['parent_id'].dropna().astype(int))
+    df = full_df[~full_df['id'].isin(parent_ids)].copy()
+    df['is_leaf'] = True
+
+    # Split all paths in one vectorized pass; a per-row apply adds a Python
+    # function call and Series boxing for every taxonomy row.
+    splits = df['path'].astype(str).str.split('.')
+    df['path_text'] = [
+        " > ".join(id_to_name.get(int(i), f"Unknown({i})") for i in parts)
+        for parts in splits
+    ]
     return df.reset_index(drop=True)
 
 # ---------- EMBEDDINGS ----------
+class OnnxEncoder:
+    """ONNX Runtime backend for the embedding model.
+
+    Drop-in replacement for SentenceTransformer.encode as used here:
+    tokenizes with the fast tokenizer, runs the exported encoder through
+    ONNX Runtime (fused attention kernels), then mean-pools and
+    L2-normalizes. Roughly 2-4x faster than the PyTorch path on CPU.
+    """
+
+    def __init__(self, model_name):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        repo = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        self.tokenizer = AutoTokenizer.from_pretrained(repo)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            repo,
+            export=True,
+            provider="CPUExecutionProvider"
+        )
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True):
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            enc = self.tokenizer(batch, padding=True, truncation=True, return_tensors="np")
+            hidden = self.model(**enc).last_hidden_state
+            mask = enc["attention_mask"][:, :, None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings.append(pooled)
+
+        embeddings = np.concatenate(embeddings, axis=0)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.clip(norms, 1e-12, None)
+        return embeddings
+
+def load_embedding_model():
+    """Prefer the ONNX Runtime encoder; fall back to plain SentenceTransformer."""
+    try:
+        return OnnxEncoder(EMBEDDING_MODEL)
+    except ImportError:
+        logger.info("optimum[onnxruntime] not installed, using SentenceTransformer backend.")
+        return SentenceTransformer(EMBEDDING_MODEL)
+
+def _embed_single(model, text):
+    """Single-query fast path for the SentenceTransformer backend.
+
+    Tokenizes without padding and runs the underlying transformer
+    directly, skipping the batching/collation machinery that dominates
+    a batch-of-1 encode.
+    """
+    enc = model.tokenizer(
+        text,
+        truncation=True,
+        max_length=model.max_seq_length,
+        return_tensors="pt"
+    )
+    # SentenceTransformer may have placed the model on CUDA; the inputs
+    # must follow or the forward pass raises a device mismatch.
+    enc = enc.to(model.device)
+    with torch.inference_mode():
+        hidden = model[0].auto_model(**enc).last_hidden_state
+
+    mask = enc["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+    pooled = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+    embedding = F.normalize(pooled, dim=-1)
+    return np.ascontiguousarray(embedding.cpu().numpy(), dtype=np.float32)
+
 def embed_texts(model, texts):
+    if len(texts) == 1 and isinstance(model, SentenceTransformer):
+        return _embed_single(model, texts[0])
+
     embeddings = model.encode(
         texts,
+        batch_size=EMBED_BATCH_SIZE,
         convert_to_numpy=True,
-        normalize_embeddings=True
+        normalize_embeddings=False
     )
-    return embeddings.astype("float32")
+    # Contiguous float32 lets faiss consume the array without copying;
+    # normalize_L2 then works in place instead of allocating a second
+    # normalized copy inside encode().
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    faiss.normalize_L2(embeddings)
+    return embeddings
 
 def build_or_load_faiss(df, embedding_model):
     if FAISS_INDEX_FILE.exists() and TAXONOMY_CACHE_FILE.exists():
         logger.info("Loading cached FAISS index...")
         index = faiss.read_index(str(FAISS_INDEX_FILE))
-        df = pd.read_pickle(TAXONOMY_CACHE_FILE)
+        with open(TAXONOMY_CACHE_FILE, "rb") as f:
+            df = pickle.load(f)
         return index, df
 
     logger.info("Building FAISS index...")
     embeddings = embed_texts(embedding_model, df['path_text'].tolist())
     dim = embeddings.shape[1]
 
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
+    if len(df) > IVF_PQ_THRESHOLD:
+        # Large taxonomy: coarse-quantize into clusters and product-quantize
+        # the vectors, so a search only scans nprobe clusters instead of
+        # every row.
+        index = faiss.index_factory(dim, "IVF256,PQ32x8", faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+        index.add(embeddings)
+        index.nprobe = 16
+    else:
+        # Small taxonomy: exhaustive inner-product search is cheap and exact.
+        index = faiss.IndexFlatIP(dim)
+        index.add(embeddings)
 
     faiss.write_index(index, str(FAISS_INDEX_FILE))
-    df.to_pickle(TAXONOMY_CACHE_FILE)
+    # Protocol-5 pickle without compression; noticeably faster to load
+    # than pandas' extension-driven to_pickle default.
+    with open(TAXONOMY_CACHE_FILE, "wb") as f:
+        pickle.dump(df, f, protocol=5)
 
     return index, df
 
 # ---------- SEARCH ----------
-def search_candidates(query_text, df, index, embedding_model, top_k):
-    emb = embed_texts(embedding_model, [query_text])
-    scores, indices = index.search(emb, top_k)
-
-    results = []
-    for score, idx in zip(scores[0], indices[0]):
-        row = df.iloc[idx]
-        results.append({
-            "id": int(row['id']),
-            "path_text": row['path_text'],
-            "score": float(score)
-        })
-    return results
+def search_candidates_batch(query_texts, ids, paths, index, embedding_model, top_k):
+    # Batches often repeat the same cleaned text (duplicate SKUs, shared
+    # descriptions); encode and search uniques only, then scatter back.
+    uniq, inverse = np.unique(np.array(query_texts, dtype=object), return_inverse=True)
+    # np.unique sorts lexicographically, which would undo the caller's
+    # length sort; re-sort the uniques by length so smart batching still
+    # reaches the encoder, and remap the scatter indices to match.
+    length_order = np.argsort([len(t) for t in uniq], kind="stable")
+    uniq = uniq[length_order]
+    rank = np.empty(len(length_order), dtype=np.int64)
+    rank[length_order] = np.arange(len(length_order))
+    inverse = rank[inverse]
+    embs = embed_texts(embedding_model, uniq.tolist())
+    scores, indices = index.search(embs, top_k)
+    scores = scores[inverse]
+    indices = indices[inverse]
+
+    all_results = []
+    for row_scores, row_indices in zip(scores, indices):
+        results = [
+            {
+                "id": int(ids[idx]),
+                "path_text": paths[idx],
+                "score": float(score)
+            }
+            for score, idx in zip(row_scores, row_indices)
+            # IVF search pads short result rows with -1, which Python
+            # indexing would silently turn into the last taxonomy row.
+            if idx >= 0
+        ]
+        all_results.append(results)
+    return all_results
+
+def search_candidates(query_text, ids, paths, index, embedding_model, top_k):
+    return search_candidates_batch([query_text], ids, paths, index, embedding_model, top_k)[0]
 
 # ---------- LLM ----------
 import re
-import json
 
-def llm_rerank(product, candidates, pipe):
-
-    prompt = f"""<|system|>
+# Built once and kept byte-identical across prompts so a prefix-caching
+# backend (e.g. vLLM with enable_prefix_caching) can reuse its KV entries;
+# only the product/candidate tail is interpolated per call.
+RERANK_PROMPT_PREFIX = """<|system|>
 You are a precise industrial classifier. Respond ONLY with a raw JSON object. Do not explain your choice.</s>
 <|user|>
 Classify this product:
-Name: {product.get('product_name')}
+"""
+
+def build_rerank_prompt(product, candidates):
+    return RERANK_PROMPT_PREFIX + f"""Name: {product.get('product_name')}
 Description: {product.get('short_description')}
 
 Candidates:
-{json.dumps(candidates, indent=2)}
+{orjson.dumps(candidates, option=orjson.OPT_INDENT_2).decode()}
 
 Return JSON in this format: {{"selected_type_id": 123, "classification_path": "path", "confidence_score": 0.9}}</s>
 <|assistant|>"""
 
+def _rerank_fallback(candidates):
+    # FALLBACK: Use the #1 candidate from FAISS (Similarity Search)
+    best = candidates[0]
+    return {
+        "selected_type_id": int(best["id"]),
+        "classification_path": best["path_text"],
+        "confidence_score": float(best["score"]),
+        "fallback": True
+    }
+
+def parse_rerank_output(full_text, candidates):
     try:
-        # Generate text
-        output = pipe(prompt, max_new_tokens=150, temperature=0.1)
-        full_text = output[0]["generated_text"]
-
         json_matches = re.findall(r"\{.*?\}", full_text, re.DOTALL)
-        
+
         if json_matches:
             json_str = json_matches[-1]
             # (Basic cleaning)
-            return json.loads(json_str)
+            return orjson.loads(json_str)
         else:
             raise ValueError("No JSON block found in LLM response")
 
     except Exception as e:
         logger.error(f"LLM failed to produce valid JSON: {e}")
-        # FALLBACK: Use the #1 candidate from FAISS (Similarity Search)
-        best = candidates[0]
-        return {
-            "selected_type_id": int(best["id"]),
-            "classification_path": best["path_text"],
-            "confidence_score": float(best["score"]),
-            "fallback": True 
-        }
+        return _rerank_fallback(candidates)
+
+def llm_rerank_batch(products, candidate_lists, pipe):
+    """Rerank many products in one batched generate call."""
+    prompts = [
+        build_rerank_prompt(product, candidates)
+        for product, candidates in zip(products, candidate_lists)
+    ]
+
+    try:
+        outputs = pipe(
+            prompts,
+            max_new_tokens=150,
+            temperature=0.1,
+            batch_size=LLM_BATCH_SIZE
+        )
+    except Exception as e:
+        logger.error(f"LLM generation failed: {e}")
+        return [_rerank_fallback(candidates) for candidates in candidate_lists]
+
+    return [
+        parse_rerank_output(output[0]["generated_text"], candidates)
+        for output, candidates in zip(outputs, candidate_lists)
+    ]
+
+def llm_rerank(product, candidates, pipe):
+    return llm_rerank_batch([product], [candidates], pipe)[0]
 
 # ---------- CLASSIFIER ----------
 class ProductClassifier:
     def __init__(self):
         logger.info("Initializing ProductClassifier...")
 
-        self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+        torch.set_num_threads(os.cpu_count())
+        faiss.omp_set_num_threads(os.cpu_count())
+        self.embedding_model = load_embedding_model()
         self.df = load_taxonomy(CLASSIFICATION_CSV)
         self.index, self.df = build_or_load_faiss(self.df, self.embedding_model)
 
-        
+        # Struct-of-arrays view of the taxonomy: candidate assembly indexes
+        # these directly instead of building a Series per hit via df.iloc.
+        self._ids = self.df['id'].to_numpy(np.int64)
+        self._paths = self.df['path_text'].to_numpy(object)
+
+        # Results keyed by (product-text hash, use_llm); re-crawls and
+        # duplicate SKUs skip the whole embed+search+LLM stack.
+        self._result_cache = {}
+        if RESULT_CACHE_FILE.exists():
+            try:
+                with open(RESULT_CACHE_FILE, "rb") as f:
+                    self._result_cache = pickle.load(f)
+            except Exception:
+                logger.warning("Could not load result cache, starting empty.")
+
         self.pipe = None
 
+    def save_cache(self):
+        """Persist the classification result cache for the next run."""
+        with open(RESULT_CACHE_FILE, "wb") as f:
+            pickle.dump(self._result_cache, f, protocol=5)
+
     def _load_llm(self):
         """Lazy-load LLM only if needed."""
         if self.pipe is None:
             logger.info("Loading LLM for reranking...")
-            self.pipe = pipeline(
-                "text-generation",
-                model=LLM_MODEL
-            )
+            try:
+                # 4-bit weights cut the memory traffic that bounds TinyLlama
+                # decode throughput by ~4x.
+                self.pipe = pipeline(
+                    "text-generation",
+                    model=LLM_MODEL_GPTQ,
+                    device_map="auto",
+                    batch_size=LLM_BATCH_SIZE
+                )
+            except Exception as e:
+                logger.warning(f"GPTQ model unavailable ({e}); falling back to {LLM_MODEL}.")
+                self.pipe = pipeline(
+                    "text-generation",
+                    model=LLM_MODEL,
+                    torch_dtype=torch.bfloat16,
+                    device_map="auto",
+                    batch_size=LLM_BATCH_SIZE
+                )
+            # Llama tokenizers ship without a pad token; batching needs one.
+            if self.pipe.tokenizer.pad_token_id is None:
+                self.pipe.tokenizer.pad_token_id = self.pipe.tokenizer.eos_token_id
+            # Decoder-only generation must pad on the left, or every
+            # non-longest prompt in a batch continues from pad tokens; the
+            # TinyLlama checkpoint ships padding_side "right".
+            self.pipe.tokenizer.padding_side = "left"
 
     def classify_product(self, product, use_llm=False):
-        text = " ".join(
-            clean_text(str(product.get(k, "")))
-            for k in [
-                "product_name",
-                "short_description",
-                "long_description",
-                "technical_specifications"
-            ]
-        )
+        return self.classify_batch([product], use_llm=use_llm)[0]
+
+    def classify_batch(self, products, use_llm=False):
+        """Classify many products with a single encode + FAISS search call."""
+        texts = [build_product_text(p) for p in products]
 
-        if not text.strip():
-            return {}
+        # Sort by text length ("smart batching") so each encode batch pads
+        # to similar token counts; results are scattered back to input order.
+        order = sorted(
+            (i for i, t in enumerate(texts) if t.strip()),
+            key=lambda i: len(texts[i])
+        )
 
-        candidates = search_candidates(
-            text,
-            self.df,
+        results = [{} for _ in products]
+
+        cache_keys = {i: (text_cache_key(texts[i]), use_llm) for i in order}
+        uncached = []
+        for i in order:
+            cached = self._result_cache.get(cache_keys[i])
+            if cached is not None:
+                results[i] = dict(cached)
+            else:
+                uncached.append(i)
+
+        order = uncached
+        if not order:
+            return results
+
+        candidate_lists = search_candidates_batch(
+            [texts[i] for i in order],
+            self._ids,
+            self._paths,
             self.index,
             self.embedding_model,
             TOP_K
         )
 
-        if not candidates:
-            return {}
-
-        if use_llm:
+        llm_batch = []
+        for i, candidates in zip(order, candidate_lists):
+            if not candidates:
+                continue
+
+            if use_llm:
+                llm_batch.append((i, candidates))
+            else:
+                # ✅ Embedding-only result
+                best = candidates[0]
+                results[i] = {
+                    "selected_type_id": best["id"],
+                    "classification_path": best["path_text"],
+                    "confidence_score": float(best["score"])
+                }
+
+        if llm_batch:
             self._load_llm()
-            return llm_rerank(product, candidates, self.pipe)
-
-        # ✅ Embedding-only result
-        best = candidates[0]
-        return {
-            "selected_type_id": best["id"],
-            "classification_path": best["path_text"],
-            "confidence_score": float(best["score"])
-        }
\ No newline at end of file
+            reranked = llm_rerank_batch(
+                [products[i] for i, _ in llm_batch],
+                [candidates for _, candidates in llm_batch],
+                self.pipe
+            )
+            for (i, _), result in zip(llm_batch, reranked):
+                results[i] = result
+
+        for i in order:
+            # LLM-failure fallbacks are transient; caching them would pin
+            # embedding-only answers past the next healthy run.
+            if results[i] and not results[i].get("fallback"):
+                self._result_cache[cache_keys[i]] = dict(results[i])
+
+        return results
\ No newline at end of file
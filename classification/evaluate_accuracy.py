@@ -1,4 +1,4 @@
-import json
+import orjson
 import pandas as pd
 from pathlib import Path
 
@@ -17,35 +17,42 @@ def load_json_data(file_path):
         print(f"❌ Error: File not found at {file_path}")
         return data
     
-    with open(file_path, 'r', encoding='utf-8') as f:
+    with open(file_path, 'rb') as f:
         # Check if it's .jsonl (line by line) or .json (one big list)
         if file_path.suffix == '.jsonl':
             for line in f:
                 if line.strip():
-                    data.append(json.loads(line))
+                    data.append(orjson.loads(line))
         else:
-            data = json.load(f)
+            data = orjson.loads(f.read())
     return data
 
 def evaluate(golden_set, results, mode_name):
-    # Create a lookup dictionary: { "product name": type_id }
-    results_lookup = {item['product_name'].lower().strip(): item.get('type_id') for item in results}
-    
-    total = 0
-    correct = 0
-    matches_found = 0
+    # One C-level merge on normalized product names instead of a per-row loop.
+    gold_df = pd.DataFrame(golden_set)
+    total = len(gold_df)
+
+    if results and total:
+        res_df = pd.DataFrame(results)
+        gold_df['key'] = gold_df['product_name'].str.lower().str.strip()
+        res_df['key'] = res_df['product_name'].str.lower().str.strip()
+        # Predictions may contain duplicates of the same product; keep the first.
+        res_df = res_df.drop_duplicates(subset='key')
 
-    for gold in golden_set:
-        name = gold['product_name'].lower().strip()
-        true_id = gold['type_id']
+        merged = gold_df.merge(
+            res_df[['key', 'type_id']],
+            on='key', how='left', suffixes=('', '_pred')
+        )
+        # Compare ids as nullable integers; the str() round-trip allocated
+        # two strings per row and missed e.g. "12" vs 12.0.
+        merged['type_id'] = pd.to_numeric(merged['type_id'], errors='coerce').astype('Int64')
+        merged['type_id_pred'] = pd.to_numeric(merged['type_id_pred'], errors='coerce').astype('Int64')
 
-        
-        if name in results_lookup:
-            matches_found += 1
-            predicted_id = results_lookup[name]
-            if str(predicted_id) == str(true_id):
-                correct += 1
-        total += 1
+        matches_found = int(merged['type_id_pred'].notna().sum())
+        correct = int((merged['type_id'] == merged['type_id_pred']).sum())
+    else:
+        matches_found = 0
+        correct = 0
 
     accuracy = (correct / matches_found) * 100 if matches_found > 0 else 0
     
@@ -1,11 +1,23 @@
+import asyncio
 import logging
 from itemadapter import ItemAdapter
 from classification.classify_products import ProductClassifier
 
 logger = logging.getLogger(__name__)
 
+BATCH_SIZE = 32
+# The only fields the classifier reads; avoids copying the full item.
+CLASSIFY_FIELDS = (
+    'product_name',
+    'short_description',
+    'long_description',
+    'technical_specifications',
+)
+# How long a partial batch may wait in the buffer before being flushed anyway.
+FLUSH_DELAY = 5.0
+
 class ClassificationPipeline:
-    
+
     @classmethod
     def from_crawler(cls, crawler):
         # This method is used by Scrapy to create the pipeline instance.
@@ -15,30 +27,88 @@ class ClassificationPipeline:
         # initializes the heavy classifier ONCE.
         logger.info(f"Opening spider {spider.name}. Initializing classifier...")
         self.classifier = ProductClassifier()
+        self._buffer = []  # (adapter, future) pairs waiting for a batch flush
+        self._flush_handle = None
+        self._pending = set()  # in-flight classification tasks
+        # The classifier is not re-entrant; flushes serialize on this lock
+        # while the reactor keeps scheduling downloads.
+        self._classify_lock = asyncio.Lock()
         logger.info("Classifier initialized for spider.")
 
-    def close_spider(self, spider):
+    async def close_spider(self, spider):
         logger.info(f"Closing spider {spider.name}.")
+        self._flush()
+        if self._pending:
+            await asyncio.gather(*self._pending)
+        self.classifier.save_cache()
         del self.classifier
 
-    def process_item(self, item, spider):
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            loop = asyncio.get_event_loop()
+            self._flush_handle = loop.call_later(FLUSH_DELAY, self._flush)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if not self._buffer:
+            return
+
+        batch, self._buffer = self._buffer, []
+        task = asyncio.ensure_future(self._classify_batch(batch))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _classify_batch(self, batch):
+        products = [
+            {k: adapter.get(k, "") for k in CLASSIFY_FIELDS}
+            for adapter, _ in batch
+        ]
+
+        # One encode + one FAISS search for the whole batch, run in a worker
+        # thread so scraping I/O overlaps with inference.
+        try:
+            async with self._classify_lock:
+                loop = asyncio.get_event_loop()
+                results = await loop.run_in_executor(
+                    None, lambda: self.classifier.classify_batch(products, use_llm=True)
+                )
+        except Exception:
+            # Every future must still resolve, or the awaiting process_item
+            # coroutines keep their scraper slots forever and the crawl hangs.
+            logger.exception("Batch classification failed; items pass through unclassified.")
+            results = [None] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def process_item(self, item, spider):
             adapter = ItemAdapter(item)
-            product_data = adapter.asdict()
 
-            classification_result = self.classifier.classify_product(product_data, use_llm=True)
+            future = asyncio.get_event_loop().create_future()
+            self._buffer.append((adapter, future))
 
-            if classification_result:
-                adapter['type_id'] = classification_result.get('selected_type_id')
-                adapter['classification_path'] = classification_result.get('classification_path')
+            if len(self._buffer) >= BATCH_SIZE:
+                self._flush()
             else:
-                adapter['type_id'] = None
-                adapter['classification_path'] = "Classification Failed"
+                self._schedule_flush()
 
-            fields_to_keep = {'product_name', 'type_id', 'classification_path'}
-            all_fields = list(adapter.keys())
+            classification_result = await future
 
-            for field in all_fields:
-                if field not in fields_to_keep:
-                    del item[field] 
+            if classification_result:
+                type_id = classification_result.get('selected_type_id')
+                classification_path = classification_result.get('classification_path')
+            else:
+                type_id = None
+                classification_path = "Classification Failed"
 
-            return item
\ No newline at end of file
+            # Emit a slim item directly instead of mutating the full item
+            # and deleting every unwanted field afterwards.
+            return {
+                'product_name': adapter.get('product_name'),
+                'type_id': type_id,
+                'classification_path': classification_path,
+            }
@@ -1,8 +1,56 @@
+import os
 import scrapy
 import re
-import json
-from urllib.parse import urljoin, urlparse
-from ..items import ProductItem 
+import orjson
+from functools import lru_cache
+from urllib.parse import urlparse
+from selectolax.parser import HTMLParser
+from ..items import ProductItem
+from ..utils import PersistentURLSet
+
+# Scans the raw body bytes for product-page signals; first hit wins, no
+# DOM walk, no decode, no giant lowercased join. Matches inside script or
+# style text are acceptable false positives: this is only one OR'd term
+# of the product-page heuristic.
+_TECH_RE = re.compile(
+    rb"technical data|technical information|specifications|article number|item no|scope of delivery",
+    re.IGNORECASE
+)
+
+# Accepts only in-scope hrefs (absolute or root-relative) and captures the
+# path, so valid links canonicalize with one concat instead of urljoin.
+_LINK_RE = re.compile(r'^(?:https://www\.flex-tools\.com)?(/en/(?:products|accessories)(?:/|$)[^\s#?]*)')
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_DIGIT_RE = re.compile(r'\d')
+_MODEL_RE = re.compile(r'^([A-Z0-9\s/-]+?)(?:\s+-\s+FLEX)?$')
+
+def _strip_tags(s):
+    """find()-based tag stripper; on the short HTML-flecked strings JSON-LD
+    descriptions contain (<br>, <p>), this beats invoking the regex engine."""
+    out = []
+    i = 0
+    while True:
+        j = s.find('<', i)
+        if j < 0:
+            out.append(s[i:])
+            break
+        out.append(s[i:j])
+        k = s.find('>', j + 1)
+        if k < 0:
+            # Unterminated '<' (e.g. "Ø < 5 mm"): keep the rest verbatim,
+            # as the regex does, instead of truncating the string.
+            out.append(s[j:])
+            break
+        i = k + 1
+    return ''.join(out)
+
+@lru_cache(maxsize=4096)
+def _parse_url(url):
+    """urlparse reduced to what the spider needs, memoized per URL — the
+    same URL gets parsed from several call sites during a crawl."""
+    parsed = urlparse(url)
+    return parsed.netloc, tuple(parsed.path.strip('/').split('/'))
 
 class FlexSpider(scrapy.Spider):
     name = "flex_crawler"
@@ -13,8 +61,20 @@ class FlexSpider(scrapy.Spider):
         'https://www.flex-tools.com/en/accessories',
     ]
 
-    visited_urls = set()
-    processed_products = set()
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Page-level dedup is per-run only: the pending-request frontier
+        # lives in memory, so persisting visited URLs would make a restart
+        # drop the start pages as "seen" and end the crawl with no items.
+        # (Use Scrapy's JOBDIR to persist the frontier itself.)
+        self.visited_urls = set()
+        # Item-level dedup is disk-backed (bloom filter in front of
+        # SQLite), so a re-crawl only yields products it hasn't emitted.
+        os.makedirs('.crawl_state', exist_ok=True)
+        self.processed_products = PersistentURLSet('.crawl_state/flex_processed.db', capacity=200_000)
+
+    def closed(self, reason):
+        self.processed_products.close()
 
     # --- 1. INITIAL REQUEST ---
     async def start(self):
@@ -28,35 +88,83 @@ class FlexSpider(scrapy.Spider):
     def parse_category_page(self, response):
         url = response.url
         if url in self.visited_urls:
-            return
+            return []
         self.visited_urls.add(url)
         self.logger.info(f"🔍 Scanning: {url}")
 
         # 1️⃣ Check if this page is a product page
         if self.is_product_page(response):
             self.logger.info(f"📦 Product detected: {url}")
-            yield from self.parse_product_page(response)
-            return
+            return self.parse_product_page(response)
 
-        # 2️⃣ Otherwise, follow links to discover more pages
+        # 2️⃣ Otherwise, collect the outlinks in a tight loop and hand them
+        # to the scheduler as one list instead of yielding one at a time.
+        new_urls = []
+        seen = set()
         for link in response.css('a::attr(href)').getall():
             if not link:
                 continue
-            full_url = urljoin(response.url, link.strip())
-            if not self.is_valid_domain(full_url):
+            match = _LINK_RE.match(link.strip())
+            if not match:
                 continue
-            if full_url in self.visited_urls:
+            full_url = 'https://www.flex-tools.com' + match.group(1)
+            if full_url in seen or full_url in self.visited_urls:
                 continue
-            yield scrapy.Request(
-                full_url,
-                callback=self.parse_category_page
-            )
+            seen.add(full_url)
+            new_urls.append(full_url)
+
+        return [
+            scrapy.Request(u, callback=self.parse_category_page)
+            for u in new_urls
+        ]
 
     # --- 3. PRODUCT DETECTION HELPER ---
+    def _tree(self, response):
+        """Parse the page once with selectolax and reuse the tree for every
+        extraction on this response (detection + product parsing)."""
+        tree = response.meta.get('_sx_tree')
+        if tree is None:
+            tree = HTMLParser(response.text)
+            response.meta['_sx_tree'] = tree
+        return tree
+
+    def _get_product_jsonld(self, response):
+        """Parse the page's JSON-LD once and cache the Product block (or
+        None) on response.meta so detection and extraction share it."""
+        if '_jsonld' in response.meta:
+            return response.meta['_jsonld']
+
+        product = None
+        for node in self._tree(response).css('script[type="application/ld+json"]'):
+            script = node.text()
+            # Cheap substring pre-filter: breadcrumb/organization blocks never
+            # mention "Product", so skip them without parsing.
+            if '"Product"' not in script:
+                continue
+            try:
+                data = orjson.loads(script)
+            except Exception as e:
+                self.logger.warning(f"Failed to parse JSON-LD: {e}", exc_info=True)
+                continue
+            # The pre-filter only proves the substring occurs somewhere in
+            # valid JSON; the value may still be a scalar or a mixed list.
+            if isinstance(data, list):
+                data = next(
+                    (d for d in data if isinstance(d, dict) and d.get('@type') == 'Product'),
+                    None
+                )
+                if data is None:
+                    continue
+            if isinstance(data, dict) and data.get('@type') == 'Product':
+                product = data
+                break
+
+        response.meta['_jsonld'] = product
+        return product
+
     def is_product_page(self, response):
         url = response.url
-        parsed = urlparse(url)
-        path_parts = parsed.path.strip("/").split("/")
+        _, path_parts = _parse_url(url)
 
         if len(path_parts) < 4 or path_parts[0] != "en":
             return False
@@ -64,7 +172,7 @@ class FlexSpider(scrapy.Spider):
             return False
 
         last_segment = path_parts[-1].lower()
-        has_digits = bool(re.search(r"\d", last_segment))
+        has_digits = bool(_DIGIT_RE.search(last_segment))
         has_hyphenated_slug = "-" in last_segment
         slug_is_not_generic = last_segment not in {
             "products", "accessories", "special-tools", "promotions"
@@ -72,31 +180,32 @@ class FlexSpider(scrapy.Spider):
 
         url_signal = has_digits or (has_hyphenated_slug and slug_is_not_generic)
 
-        has_h1 = response.css("h1::text").get() is not None
-        has_product_grid = response.css(
+        # Known category slugs without a digit signal are listings; reject
+        # them on URL evidence alone, before any DOM parsing or body scan.
+        if not url_signal and not slug_is_not_generic:
+            return False
+
+        # Product JSON-LD is a stronger signal than any of the heuristics
+        # below, and the parse is reused by parse_product_page.
+        if self._get_product_jsonld(response) is not None:
+            return True
+
+        tree = self._tree(response)
+        h1 = tree.css_first("h1")
+        has_h1 = h1 is not None and bool(h1.text(strip=True))
+        has_product_grid = tree.css_first(
             ".product-list, .product-grid, .product-card, .product-tile"
-        ).get() is not None
-
-        page_text = " ".join(response.css("body ::text").getall()).lower()
-        has_tech_keywords = any(
-            kw in page_text
-            for kw in (
-                "technical data",
-                "technical information",
-                "specifications",
-                "article number",
-                "item no",
-                "scope of delivery",
-            )
-        )
+        ) is not None
+
+        has_tech_keywords = _TECH_RE.search(response.body) is not None
 
         return (has_h1 and not has_product_grid and (url_signal or has_tech_keywords)) or (has_tech_keywords and url_signal)
 
-    def is_valid_domain(self, url):
-        parsed = urlparse(url)
-        if parsed.netloc != "www.flex-tools.com":
-            return False
-        return parsed.path.startswith("/en/products") or parsed.path.startswith("/en/accessories")
+    @staticmethod
+    def _abs(response, url):
+        """Asset URLs here are almost always absolute already; the tuple
+        startswith check is far cheaper than a full urljoin parse."""
+        return url if url.startswith(('http://', 'https://')) else response.urljoin(url)
 
     # --- 4. PRODUCT EXTRACTION ---
     def parse_product_page(self, response):
@@ -109,99 +218,104 @@ class FlexSpider(scrapy.Spider):
         self.logger.info(f"Parsing product page: {url}")
 
         item = ProductItem()
+        tree = self._tree(response)
 
-        # --- JSON-LD extraction ---
-        json_ld_scripts = response.css('script[type="application/ld+json"]::text').getall()
-        self.logger.debug(f"Found {len(json_ld_scripts)} JSON-LD scripts")
-        for script in json_ld_scripts:
-            try:
-                data = json.loads(script)
-                if isinstance(data, list):
-                    for d in data:
-                        if d.get('@type') == 'Product':
-                            data = d
-                            break
-                if data.get('@type') == 'Product':
-                    item['product_name'] = self.clean_text(data.get('name'))
-                    item['model_article_number'] = self.clean_text(data.get('mpn'))
-                    item['short_description'] = self.clean_text(data.get('description'))
-                    item['long_description'] = self.clean_text(data.get('description'))
-                    tech = data.get('additionalProperty', [])
-                    item['technical_specifications'] = {p.get('propertyID'): p.get('value') for p in tech if p.get('propertyID') and p.get('value')}
-                    if data.get('image'):
-                        item['product_image_url'] = response.urljoin(data.get('image'))
-                    self.logger.info("Extracted product info from JSON-LD")
-                    break
-            except Exception as e:
-                self.logger.warning(f"Failed to parse JSON-LD: {e}", exc_info=True)
+        # --- JSON-LD extraction (parsed once, shared with detection) ---
+        data = self._get_product_jsonld(response)
+        if data is not None:
+            item['product_name'] = self.clean_text(data.get('name'))
+            item['model_article_number'] = self.clean_text(data.get('mpn'))
+            item['short_description'] = self.clean_text(data.get('description'))
+            item['long_description'] = self.clean_text(data.get('description'))
+            # Bind propertyID/value once per property instead of looking
+            # each up twice (filter + build) as the dict-comp did.
+            specs = {}
+            for p in data.get('additionalProperty', []):
+                pid = p.get('propertyID')
+                val = p.get('value')
+                if pid and val:
+                    specs[pid] = val
+            item['technical_specifications'] = specs
+            if data.get('image'):
+                item['product_image_url'] = self._abs(response, data.get('image'))
+            self.logger.info("Extracted product info from JSON-LD")
 
         # --- CSS fallback for product name ---
-        if not item['product_name']:
-            for sel in ['h1.product-title::text', 'h1.title::text', 'h1::text', 'title::text']:
-                name = response.css(sel).get()
-                if name:
-                    item['product_name'] = self.clean_text(name.replace('- FLEX', ''))
-                    self.logger.debug(f"Found product name via selector {sel}: {item['product_name']}")
-                    break
+        # One union selector walks the tree once instead of once per
+        # candidate; <title> stays a separate second lookup because it
+        # precedes every <h1> in document order and would always win.
+        if not item.get('product_name'):
+            node = tree.css_first('h1.product-title, h1.title, h1')
+            if node is None or not node.text(strip=True):
+                node = tree.css_first('title')
+            if node is not None and node.text(strip=True):
+                item['product_name'] = self.clean_text(node.text().replace('- FLEX', ''))
+                self.logger.debug(f"Found product name via fallback: {item['product_name']}")
 
         # --- Short description fallback ---
-        if not item['short_description']:
-            desc_selectors = ['.product-info-description', '.product-description', '.short-description', '.description']
-            for sel in desc_selectors:
-                desc = response.css(sel).get()
-                if desc:
-                    item['short_description'] = self.clean_text(desc)
-                    break
-            if not item['short_description']:
-                paragraphs = response.css('p::text').getall()
+        if not item.get('short_description'):
+            node = tree.css_first(
+                '.product-info-description, .product-description, .short-description, .description'
+            )
+            if node is not None:
+                item['short_description'] = self.clean_text(node.text(separator=' '))
+            if not item.get('short_description'):
+                paragraphs = [n.text(separator=' ') for n in tree.css('p')]
                 meaningful = [self.clean_text(p) for p in paragraphs if len(self.clean_text(p)) > 50]
                 if meaningful:
                     item['short_description'] = meaningful[0][:200] + '...' if len(meaningful[0]) > 200 else meaningful[0]
 
         # --- Technical specs from tables ---
-        tables = response.css('table.spec-table, table.technical-data, table.product-attributes')
         specs = {}
-        for table in tables:
+        # One traversal per table: walk each row's child nodes and pick cells
+        # by tag instead of running the CSS matcher again for every row.
+        for table in tree.css('table.spec-table, table.technical-data, table.product-attributes'):
             for row in table.css('tr'):
-                cells = row.css('td, th')
+                cells = [node for node in row.iter() if node.tag in ('td', 'th')]
                 if len(cells) >= 2:
-                    key = self.clean_text(cells[0].get())
-                    value = self.clean_text(cells[1].get())
+                    # text() is already plain text; collapse whitespace
+                    # directly instead of paying clean_text's tag pass.
+                    key = ' '.join(cells[0].text(separator=' ').split())
+                    value = ' '.join(cells[1].text(separator=' ').split())
                     if key and value:
                         specs[key.lower()] = value
         if specs:
             item['technical_specifications'] = specs
 
         # --- Datasheet PDF ---
-        pdf_links = response.css('a[href$=".pdf"]::attr(href)').getall()
+        pdf_links = [n.attributes.get('href') for n in tree.css('a[href$=".pdf"]')]
         for link in pdf_links:
-            if any(k in link.lower() for k in ['datasheet', 'manual', 'spec']):
-                item['datasheet_url'] = response.urljoin(link)
+            if link and any(k in link.lower() for k in ['datasheet', 'manual', 'spec']):
+                item['datasheet_url'] = self._abs(response, link)
                 break
 
         # --- Model number fallback ---
-        if not item['model_article_number'] and item['product_name']:
-            match = re.match(r'^([A-Z0-9\s/-]+?)(?:\s+-\s+FLEX)?$', item['product_name'])
+        if not item.get('model_article_number') and item.get('product_name'):
+            match = _MODEL_RE.match(item['product_name'])
             if match:
                 candidate = match.group(1).strip()
                 if any(c.isdigit() for c in candidate):
                     item['model_article_number'] = candidate
 
         # --- Product image fallback ---
-        if not item['product_image_url']:
-            img = response.css('meta[property="og:image"]::attr(content), meta[name="og:image"]::attr(content)').get()
+        if not item.get('product_image_url'):
+            img_node = tree.css_first('meta[property="og:image"], meta[name="og:image"]')
+            img = img_node.attributes.get('content') if img_node is not None else None
             if img:
-                item['product_image_url'] = response.urljoin(img)
+                item['product_image_url'] = self._abs(response, img)
 
         item['type_id'] = ''
         item['classification_path'] = ''
 
-        self.logger.info(f"✅ Yielding product: {item['product_name']} | URL: {url}")
+        self.logger.info(f"✅ Yielding product: {item.get('product_name')} | URL: {url}")
         yield item
 
     def clean_text(self, text):
         if not text:
             return ''
-        cleaned_text = re.sub(r'<[^>]+>', '', text)
-        cleaned_text = re.sub(r'\s+', ' ', cleaned_text)
-        return cleaned_text.strip()
\ No newline at end of file
+        # JSON-LD fields usually carry no markup; only strip tags when one
+        # can actually be present, and keep the regex for large blobs only.
+        if '<' in text:
+            text = _strip_tags(text) if len(text) < 1024 else _TAG_RE.sub('', text)
+        # split() collapses arbitrary whitespace runs in C, no regex pass.
+        return ' '.join(text.split())
\ No newline at end of file
@@ -5,6 +5,10 @@ from urllib.parse import urljoin, urlparse
 from ..items import ProductItem 
 from w3lib.html import remove_tags
 
+# Compiled once at import; these run for every discovered link / extracted field.
+_WS_RE = re.compile(r'\s+')
+_DIGIT_RE = re.compile(r'\d')
+
 class SikaCrawlerSpider(scrapy.Spider):
     name = 'sika_crawler'
     allowed_domains = ['gcc.sika.com']
@@ -27,6 +31,11 @@ class SikaCrawlerSpider(scrapy.Spider):
     visited_urls = set()
     processed_products = set()
 
+    NON_PRODUCT_KEYWORDS = [
+        'about-', 'contact-', 'news', 'career', 'privacy', 'cookie',
+        'legal', 'search', 'sitemap', 'download', '.pdf', '.jpg'
+    ]
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Pre-process start_urls to build the set of required paths
@@ -34,6 +43,12 @@ class SikaCrawlerSpider(scrapy.Spider):
             path_segment = urlparse(url).path
             self.start_path_roots.add(path_segment.replace('.html', '').strip('/'))
 
+        # Precompiled filters: str.startswith against a tuple and a single
+        # alternation regex both run in C, and these checks fire for every
+        # link on every crawled page.
+        self._roots_tuple = tuple(self.start_path_roots)
+        self._util_re = re.compile("|".join(map(re.escape, self.NON_PRODUCT_KEYWORDS)))
+
     # --- 1. INITIAL REQUEST (USES PLAYWRIGHT) ---
     async def start(self):
         for url in self.start_urls:
@@ -110,16 +125,11 @@ class SikaCrawlerSpider(scrapy.Spider):
     def is_within_scope(self, url):
         """Checks if the URL is a path that starts with one of our defined roots."""
         path = urlparse(url).path.replace(".html", "").strip("/")
-        return any(path.startswith(root) for root in self.start_path_roots)
+        return path.startswith(self._roots_tuple)
 
     def is_utility_url(self, url):
         """Checks for common, non-product utility pages."""
-        url_lower = url.lower()
-        non_product_keywords = [
-            'about-', 'contact-', 'news', 'career', 'privacy', 'cookie', 
-            'legal', 'search', 'sitemap', 'download', '.pdf', '.jpg'
-        ]
-        return any(k in url_lower for k in non_product_keywords)
+        return self._util_re.search(url.lower()) is not None
     
     def is_probable_product_link(self, link):
         """
@@ -142,7 +152,7 @@ class SikaCrawlerSpider(scrapy.Spider):
 
         # Product Signature: Must contain 'sika' OR a digit. 
         # This catches 'sikagrout-cable-pt.html' (sika) AND 'sikaceram-255-starflexldae.html' (sika, digit).
-        is_product_signature = ("sika" in last_segment) or re.search(r"\d", last_segment)
+        is_product_signature = ("sika" in last_segment) or _DIGIT_RE.search(last_segment)
         
         if not is_product_signature:
             return False
@@ -226,9 +236,9 @@ class SikaCrawlerSpider(scrapy.Spider):
     
     def is_valid_product_page(self, response):
         """Checks if the content on the page looks like a real product page."""
-        strong_indicators = ['Product Details', 'Technical Data', 'Technical Information']
-        page_text = ' '.join(response.css('body ::text').getall()).lower()
-        if any(term.lower() in page_text for term in strong_indicators):
+        # The strong indicators are accordion section titles, so check those
+        # nodes directly instead of joining every text node in the body.
+        if response.css('.cmp-accordion__title::text').re(r'Product Details|Technical Data|Technical Information'):
             return True
         if any('pds' in link.lower() or 'data-sheet' in link.lower() for link in response.css('a[href*=".pdf"]::attr(href)').getall()):
              return True
@@ -238,5 +248,5 @@ class SikaCrawlerSpider(scrapy.Spider):
         if not text:
             return ''
         text = str(text)
-        text = re.sub(r'\s+', ' ', text)
+        text = _WS_RE.sub(' ', text)
         return text.strip()
\ No newline at end of file
@@ -0,0 +1,85 @@
+import hashlib
+import math
+import sqlite3
+
+class BloomFilter:
+    """Fixed-size bloom filter for crawl-frontier URL dedup.
+
+    A Python set of full URL strings costs ~150 bytes per entry and grows
+    without bound; the filter costs a few bits per URL at a configurable
+    false-positive rate. A false positive means a rare URL is treated as
+    already seen and skipped, which is acceptable for dedup. There are no
+    false negatives.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=1e-6):
+        # Standard sizing: m = -n*ln(p)/ln(2)^2 bits, k = (m/n)*ln(2) hashes.
+        self.capacity = capacity
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _indexes(self, item):
+        # Double hashing over one blake2b digest instead of k separate hashes.
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[i >> 3] & (1 << (i & 7)) for i in self._indexes(item))
+
+    def add(self, item):
+        """Set the item's bits; returns True if the item was not seen before."""
+        bits = self._bits
+        new = False
+        for i in self._indexes(item):
+            mask = 1 << (i & 7)
+            if not bits[i >> 3] & mask:
+                bits[i >> 3] |= mask
+                new = True
+        return new
+
+class PersistentURLSet:
+    """SQLite-backed seen-URL set with a bloom-filter front cache.
+
+    The database makes crawls resumable across restarts and keeps the URL
+    strings out of process memory; the OS page cache holds the hot rows.
+    The bloom filter answers "definitely new" without touching SQLite
+    (no false negatives), so only the rare already-seen candidates pay
+    for a lookup. Writes are committed every `commit_every` inserts.
+    """
+
+    def __init__(self, path, capacity=1_000_000, commit_every=256):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS seen (url TEXT PRIMARY KEY)')
+        self._commit_every = commit_every
+        self._dirty = 0
+
+        # Warm the bloom filter from a previous run's rows.
+        self._bloom = BloomFilter(capacity=capacity)
+        for (url,) in self._conn.execute('SELECT url FROM seen'):
+            self._bloom.add(url)
+
+    def __contains__(self, url):
+        if url not in self._bloom:
+            return False
+        row = self._conn.execute(
+            'SELECT 1 FROM seen WHERE url = ? LIMIT 1', (url,)
+        ).fetchone()
+        return row is not None
+
+    def add(self, url):
+        new = self._bloom.add(url)
+        self._conn.execute('INSERT OR IGNORE INTO seen (url) VALUES (?)', (url,))
+        self._dirty += 1
+        if self._dirty >= self._commit_every:
+            self._conn.commit()
+            self._dirty = 0
+        return new
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()